@@ -25,15 +25,15 @@
 # Input Section --------------------------------------------------------------------------------------------------------
 #%option
 #% key: username
-#% description: Username for Copernicus Open Acces Hub.
-#% required: yes
+#% description: Username for Copernicus Open Acces Hub (Default is the environment variable SCIHUB_USER).
+#% required: no
 #%guisection: User
 #%end
 
 #%option
 #% key: password
-#% description:  Password for Copernicus Open Access Hub.
-#% required: yes
+#% description:  Password for Copernicus Open Access Hub (Default is the environment variable SCIHUB_PASS).
+#% required: no
 #%guisection: User
 #%end
 
@@ -116,6 +116,15 @@
 
 
 # Optional Section -----------------------------------------------------------------------------------------------------
+#%option
+#% key: jobs
+#% type: integer
+#% required: no
+#% answer: 2
+#% description: Number of parallel downloads.
+#% guisection: Optional
+#%end
+
 #%flag
 #% key: p
 #% description: Print the detected files and exit.
@@ -123,6 +132,7 @@
 #%end
 
 
+import functools
 import os
 import sys
 
@@ -133,6 +143,8 @@ except ImportError:
 
 from sentinelsat.sentinel import SentinelAPI, read_geojson, geojson_to_wkt
 
+_API_URL = 'https://scihub.copernicus.eu/dhus'
+
 
 class S1Download(object):
     """
@@ -142,9 +154,9 @@ class S1Download(object):
     Parameters
     ----------
     username : str
-        Username for Copernicus Open Access Hub
+        Username for Copernicus Open Access Hub. If None, the environment variable SCIHUB_USER is used.
     password : str
-        Password for Copernicus Open Access Hub
+        Password for Copernicus Open Access Hub. If None, the environment variable SCIHUB_PASS is used.
     region : str
         A geojson file.
     timestart : str
@@ -173,12 +185,16 @@ class S1Download(object):
         A geojson to WKT object.
     kwargs : dict
         Dictionary with setted attributes.
+    products : OrderedDict
+        The detected products. The hub is queried on the first access.
     files : DataFrame
         Pandas DataFrame with detected files.
 
     Methods
     -------
-    download()
+    search()
+        Query the hub for the products.
+    download(n_concurrent_dl=2)
         Download all files.
     print_products()
         Print all detected files.
@@ -187,8 +203,8 @@ class S1Download(object):
     --------
     The general usage is
     ::
-        $ ds1.download [-p] username=string password=string region=string timestart=string timeend=string outdir=sting
-        [*attributes=string] [--verbose] [--quiet]
+        $ ds1.download [-p] [username=string] [password=string] region=string timestart=string timeend=string
+        outdir=sting [jobs=integer] [*attributes=string] [--verbose] [--quiet]
 
     For *attributes the following parameters can be used
     ::
@@ -212,13 +228,18 @@ class S1Download(object):
                  sensoroperationalmode=None, orbitnumber=None, orbitdirection=None):
 
         # Inititalise Sentinel Python API ------------------------------------------------------------------------------
-        self.api = SentinelAPI(username, password, 'https://scihub.copernicus.eu/dhus')
+        username = username or os.environ.get('SCIHUB_USER')
+        password = password or os.environ.get('SCIHUB_PASS')
+
+        if username is None or password is None:
+            gs.fatal(_('No credentials for the Copernicus Open Access Hub. Set username and password or the '
+                       'environment variables SCIHUB_USER and SCIHUB_PASS'))
+
+        self.api = _api(username, password, _API_URL)
 
         # Initialize Directory -----------------------------------------------------------------------------------------
-        if not os.path.exists(outdir):
-            os.makedirs(outdir)
-        else:
-            self.outdir = outdir
+        os.makedirs(outdir, exist_ok=True)
+        self.outdir = outdir
 
         # Initialise Mandatory Parameter ------------------------------------------------------------------------------
         self.region = geojson_to_wkt(read_geojson(region))
@@ -248,13 +269,46 @@ class S1Download(object):
             if item is not None:
                 self.kwargs[__KEYS__[i]] = item
 
-        # Inititalise Sentinel Producs with API ------------------------------------------------------------------------
-        self.products = self.api.query(self.region, date=self.date, platformname='Sentinel-1', **self.kwargs)
+        # The hub is queried when the products are needed for the first time.
+        self._products = None
+
+    @property
+    def products(self):
+        if self._products is None:
+            self.search()
+
+        return self._products
+
+    @property
+    def files(self):
+        return self.api.to_dataframe(self.products)
+
+    def search(self):
+        """
+        Query the Copernicus Open Access Hub for the products.
+
+        Returns
+        -------
+        OrderedDict
+        """
+        self._products = self.api.query(self.region, date=self.date, platformname='Sentinel-1', **self.kwargs)
+
+        return self._products
+
+    def download(self, n_concurrent_dl=2):
+        """
+        Download all detected products.
 
-        self.files = self.api.to_dataframe(self.products)
+        Parameters
+        ----------
+        n_concurrent_dl : int
+            Number of parallel downloads. The hub allows only a few concurrent downloads per user.
 
-    def download(self):
-        self.api.download_all(self.products, directory_path=self.outdir)
+        Returns
+        -------
+        int
+        """
+        self.api.download_all(self.products, directory_path=self.outdir, n_concurrent_dl=n_concurrent_dl)
         return 0
 
     def print_products(self):
@@ -270,6 +324,27 @@ class S1Download(object):
         sys.stdout.write(df)
 
 
+@functools.lru_cache(maxsize=4)
+def _api(username, password, url):
+    """
+    Sentinelsat API for a user. The session is shared between all queries and downloads of this user.
+
+    Parameters
+    ----------
+    username : str
+        Username for Copernicus Open Access Hub.
+    password : str
+        Password for Copernicus Open Access Hub.
+    url : str
+        URL of the hub.
+
+    Returns
+    -------
+    SentinelAPI
+    """
+    return SentinelAPI(username, password, url)
+
+
 def change_dict_value(dictionary, old_value, new_value):
     """
     Change a certain value from a dictionary.
@@ -286,12 +361,9 @@ def change_dict_value(dictionary, old_value, new_value):
     Returns
     -------
     dict
+        A new dictionary, the input is not modified.
     """
-    for key, value in dictionary.items():
-        if value == old_value:
-            dictionary[key] = new_value
-
-    return dictionary
+    return {key: (new_value if value == old_value else value) for key, value in dictionary.items()}
 
 
 def tuple_multi_string(dictionary, sep=','):
@@ -341,7 +413,7 @@ def main():
         downloader.print_products()
         return 0
 
-    downloader.download()
+    downloader.download(n_concurrent_dl=int(options['jobs'] or 2))
 
     return 0
 
@@ -177,12 +177,9 @@ def change_dict_value(dictionary, old_value, new_value):
     Returns
     -------
     dict
+        A new dictionary, the input is not modified.
     """
-    for key, value in dictionary.items():
-        if value == old_value:
-            dictionary[key] = new_value
-
-    return dictionary
+    return {key: (new_value if value == old_value else value) for key, value in dictionary.items()}
 
 
 def main():
@@ -237,13 +237,13 @@ class DirImport(object):
             else:
                 module = 'r.in.gdal'
 
-            for f in self.files:
-                if link or (not link and not reproject):
-                    if not self.__check_projection(f):
-                        gs.fatal(_('Projection of dataset does not appear to match current location. '
-                                   'Force reprojecting dataset by -r flag.'))
+        for f in self.files:
+            if link or (not link and not reproject):
+                if not self.__check_projection(f):
+                    gs.fatal(_('Projection of dataset does not appear to match current location. '
+                               'Force reprojecting dataset by -r flag.'))
 
-                self.__import_file(f, module, args)
+            self.__import_file(f, module, args)
 
     def create_mapset(self, mapset, dbase=None, location=None):
         """
@@ -275,7 +275,7 @@ class DirImport(object):
         """
         for f in self.files:
             sys.stdout.write(
-                'Detected File <{0}> {1} (EPSG: {2}){3}'.format(str(f), '1' if self.__check_projection(f) else '0',
+                'Detected File <{0}> {1} (EPSG: {2}){3}'.format(f, '1' if self.__check_projection(f) else '0',
                                                                 str(self.__raster_epsg(f)), os.linesep))
 
     # ------------------------------------------------------------------------------------------------------------------
@@ -285,10 +285,13 @@ class DirImport(object):
         pattern = re.compile(filter_p)
         files = []
         for rec in os.walk(self.input_dir):
+            # Hidden directories and files, e.g. the caches of pr.geocode, are not imported.
+            rec[1][:] = [item for item in rec[1] if not item.startswith('.')]
+
             if not rec[-1]:
                 continue
 
-            match = filter(pattern.match, rec[-1])
+            match = filter(pattern.match, (item for item in rec[-1] if not item.startswith('.')))
             if match is None:
                 continue
 
@@ -342,7 +345,7 @@ class DirImport(object):
             gs.raster_history(mapname)
 
         except CalledModuleError as e:
-            pass
+            gs.warning(_('Unable to import <{0}>: {1}').format(mapname, e))
 
 
 def change_dict_value(dictionary, old_value, new_value):
@@ -361,12 +364,9 @@ def change_dict_value(dictionary, old_value, new_value):
     Returns
     -------
     dict
+        A new dictionary, the input is not modified.
     """
-    for key, value in dictionary.items():
-        if value == old_value:
-            dictionary[key] = new_value
-
-    return dictionary
+    return {key: (new_value if value == old_value else value) for key, value in dictionary.items()}
 
 
 def main():
@@ -394,7 +394,7 @@ class FinderImport(object):
         """
         for f in self.files:
             sys.stdout.write(
-                'Detected File <{0}> {1} (EPSG: {2}){3}'.format(str(f), '1' if self.__check_projection(f) else '0',
+                'Detected File <{0}> {1} (EPSG: {2}){3}'.format(f, '1' if self.__check_projection(f) else '0',
                                                                 str(self.__raster_epsg(f)), os.linesep))
 
     # ------------------------------------------------------------------------------------------------------------------
@@ -465,12 +465,9 @@ def change_dict_value(dictionary, old_value, new_value):
     Returns
     -------
     dict
+        A new dictionary, the input is not modified.
     """
-    for key, value in dictionary.items():
-        if value == old_value:
-            dictionary[key] = new_value
-
-    return dictionary
+    return {key: (new_value if value == old_value else value) for key, value in dictionary.items()}
 
 
 def tuple_multi_string(dictionary, sep=','):
@@ -218,10 +218,8 @@ class OutLGdal(object):
                  output=None, createopt=None, metaopt=None, nodata=None, suffix=False):
 
         # Initialize Directory -----------------------------------------------------------------------------------------
-        if not os.path.exists(outdir):
-            os.makedirs(outdir)
-        else:
-            self.outdir = outdir
+        os.makedirs(outdir, exist_ok=True)
+        self.outdir = outdir
 
         # Create Pattern and find files --------------------------------------------------------------------------------
         self.type = type
@@ -292,7 +290,7 @@ class OutLGdal(object):
         """
         for f in files:
             sys.stdout.write(
-                'Detected File <{0}> {1}'.format(str(f), os.linesep))
+                'Detected File <{0}> {1}'.format(f, os.linesep))
 
     # ------------------------------------------------------------------------------------------------------------------
     # Private Methods
@@ -339,12 +337,9 @@ def change_dict_value(dictionary, old_value, new_value):
     Returns
     -------
     dict
+        A new dictionary, the input is not modified.
     """
-    for key, value in dictionary.items():
-        if value == old_value:
-            dictionary[key] = new_value
-
-    return dictionary
+    return {key: (new_value if value == old_value else value) for key, value in dictionary.items()}
 
 
 def main():
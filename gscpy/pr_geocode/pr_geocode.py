@@ -120,6 +120,29 @@
 #% guisection: Filter
 #%end
 
+# Processing Section ---------------------------------------------------------------------------------------------------
+#%flag
+#% key: m
+#% description: Skip the multilooking of the SAR scene.
+#% guisection: Processing
+#%end
+
+#%flag
+#% key: n
+#% description: Skip the terrain flattening of the SAR scene.
+#% guisection: Processing
+#%end
+
+#%option
+#% key: speckle_filter
+#% type: string
+#% required: no
+#% multiple: no
+#% options: Boxcar, Median, Frost, Gamma Map, Lee, Refined Lee, Lee Sigma, IDAN
+#% description: Speckle filter applied to the SAR scene (Default is no filter):
+#% guisection: Processing
+#%end
+
 # DEM Section ----------------------------------------------------------------------------------------------------------
 #%flag
 #% key: e
@@ -163,12 +186,6 @@
 #% guisection: Import
 #%end
 
-#%option
-#% key: pattern
-#% description: The pattern of file names.
-#% guisection: Import
-#%end
-
 # Mapset Section -------------------------------------------------------------------------------------------------------
 #%flag
 #% key: c
@@ -221,26 +238,75 @@
 #% guisection: Optional
 #%end
 
+#%flag
+#% key: w
+#% description: Write a warped VRT preview of each scene instead of geocoding it with SNAP
+#% guisection: Optional
+#%end
 
-import datetime as dt
+#%option
+#% key: jobs
+#% type: integer
+#% required: no
+#% multiple: no
+#% answer: 1
+#% description: Number of scenes to be processed at the same time:
+#% guisection: Optional
+#%end
+
+
+import asyncio
+import functools
+import glob
+import hashlib
+import logging
 import os
+import pickle
 import re
+import shutil
+import stat
 import sys
-
-from pyroSAR.snap.util import geocode
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future, ProcessPoolExecutor
 
 try:
     import grass.script as gs
-    from grass.exceptions import CalledModuleError
 except ImportError:
     raise ImportError("You have to install GRASS GIS to run this program.")
 
-try:
-    from osgeo import gdal, osr
-except ImportError as e:
-    gs.fatal(_("Parameter t_srs_from_file requires GDAL library: {}").format(e))
+# pyroSAR, GDAL and i.dr.import, which loads GDAL, are imported where they are used. Importing pyroSAR loads the
+# SNAP configuration, which is neither needed to parse the options nor to print the detected files.
 
-    raise ImportError("You have to install GRASS GIS to run this program.")
+os.environ.setdefault('GDAL_CACHEMAX', '512')
+
+log = logging.getLogger('gscpy.geocode')
+
+# Creation options for the geocoded GeoTIFFs. SNAP writes stripped and uncompressed files, tiles speed up the
+# following r.import and gdalwarp passes.
+_TILE_OPTIONS = ['TILED=YES', 'BLOCKXSIZE=512', 'BLOCKYSIZE=512', 'COMPRESS=DEFLATE', 'PREDICTOR=3',
+                 'BIGTIFF=IF_SAFER']
+
+# The DEM subset is cut with a margin in degrees around the scenes, since the terrain correction needs the
+# surrounding heights. The DEM may be an integer raster, so no floating point predictor is used.
+_DEM_BUFFER = 0.1
+_DEM_OPTIONS = ['TILED=YES', 'COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER']
+
+# All polarizations of Sentinel-1. pyroSAR only processes the ones that are available in a scene.
+_POLARIZATIONS = ('VV', 'VH', 'HH', 'HV')
+
+# Input and output file of a SNAP workflow.
+_READ_FILE = ".//node[@id='Read']/parameters/file"
+_WRITE_FILE = ".//node[@id='Write']/parameters/file"
+_ORBIT_TYPE = ".//node[@id='Apply-Orbit-File']/parameters/orbitType"
+
+# Orbit types of SNAP's Apply-Orbit-File for precise (POE) and restituted (RES) Sentinel-1 orbit files.
+_ORBIT_TYPES = {'POE': 'Sentinel Precise (Auto Download)', 'RES': 'Sentinel Restituted (Auto Download)'}
+
+# Sentinel-1 GRD products of older IPF versions contain border noise, which pyroSAR removes from the scene itself
+# before SNAP runs.
+_IPF_BORDER_NOISE = 2.9
 
 
 class Geocode(object):
@@ -284,16 +350,33 @@ class Geocode(object):
          names of additional parameters to append to the basename, e.g. ['orbitNumber_rel']
      test: bool, optional
          If set to True the workflow xml file is only written and not executed. Default is False.
+     jobs: int, optional
+         Number of scenes that are processed at the same time. Default is 1.
+     multilook: bool, optional
+         Apply multilooking to the SAR scene? Default is True.
+     terrainFlattening: bool, optional
+         Apply terrain flattening to the SAR scene? Default is True.
+     speckleFilter: str or False, optional
+         Name of the speckle filter applied by SNAP, e.g. 'Refined Lee'. Default is False (no filter).
+     vrt_only: bool, optional
+         If set to True SNAP is not started. Instead a VRT per scene is written that warps the scene with its ground
+         control points into t_srs. Default is False.
+     overwrite: bool, optional
+         If set to True scenes are processed again even if their GeoTIFFs already exist in outdir. Default is False.
 
      Attributes
      ----------
      files : list
-         All detected files.
+         All detected files that are supported by pyroSAR. The files are detected and identified on first access.
 
      Methods
      -------
      geocode()
          Start the geocoding process.
+     geocode_async()
+         Coroutine of the geocoding process.
+     validate()
+         Check all parameters before the geocoding process is started.
      import_products(pattern=None, mapset=None, dbase=None, location=None, flags=None)
          Import detected files.
      print_products()
@@ -303,10 +386,11 @@ class Geocode(object):
      --------
      The general usage is
      ::
-         $ pr.geocode [-e -i -r -l -c -p -t -b] input_dir=string outdir=string [pattern=string] [t_srs=string] [t_srs_from_file=string]
+         $ pr.geocode [-e -i -r -l -c -p -t -b -m -n -w] input_dir=string outdir=string [pattern=string] [t_srs=string] [t_srs_from_file=string]
              [resolution_value=integer] [polarizations=string] [shapefile=string] [scaling=string]
              [geocoding_type=string] [offset=string] [external_dem_file=string] [external_dem_nan=integer]
-             [basename_extensions=string] [mapset=string] [dbase=string] [location=string] [--verbose] [--quiet]
+             [basename_extensions=string] [mapset=string] [dbase=string] [location=string] [jobs=integer]
+             [speckle_filter=string] [--verbose] [--quiet]
 
 
      Import Sentinel 1A files geocode and import them in current mapset and reproject it
@@ -325,6 +409,9 @@ class Geocode(object):
      If GeoTiff would directly be selected as output format for multiple polarizations then a multilayer GeoTiff
      is written by SNAP which is an unfavorable format
 
+     Scenes whose GeoTIFFs already exist in the output directory are skipped. Use the GRASS option --overwrite to
+     process them again.
+
      Notes
      -----
      **Flags:**
@@ -336,13 +423,18 @@ class Geocode(object):
          * p : Print the detected files and exit.
          * t : Write only the workflow in xml file
          * b : Enables removal of S1 GRD border noise.
+         * m : Skip the multilooking of the SAR scene.
+         * n : Skip the terrain flattening of the SAR scene.
+         * w : Write a warped VRT preview of each scene instead of geocoding it with SNAP.
 
      """
 
     def __init__(self, input_dir, outdir, pattern=None, t_srs=None, t_srs_from_file=None, resolution_value=20,
                  polarizations='all', shapefile=None, scaling='dB', geocoding_type='Range-Doppler',
                  removeS1BoderNoise=True, offset=None, external_dem_file=None, external_dem_nan=None,
-                 externalDEMApplyEGM=True, basename_extensions=None, test=False, verbose=False):
+                 externalDEMApplyEGM=True, basename_extensions=None, test=False, verbose=False, jobs=1,
+                 multilook=True, terrainFlattening=True, speckleFilter=False,
+                 vrt_only=False, overwrite=False):
 
         # Check Georeference -------------------------------------------------------------------------------------------
         if t_srs is None and t_srs_from_file is None:
@@ -363,7 +455,7 @@ class Geocode(object):
 
                 else:
                     self.t_srs_from_file = t_srs_from_file
-                    self.t_srs = self.__raster_epsg(self.t_srs_from_file)
+                    self.t_srs = _raster_epsg(os.path.abspath(self.t_srs_from_file))
 
             else:
                 self.t_srs_from_file = None
@@ -371,44 +463,75 @@ class Geocode(object):
         # Initialize Directory -----------------------------------------------------------------------------------------
         self._dir_list = []
 
-        if not os.path.exists(input_dir):
+        try:
+            mode = os.stat(input_dir).st_mode
+        except FileNotFoundError:
             gs.fatal(_('Input directory <{}> not exists').format(input_dir))
+        except OSError as e:
+            gs.fatal(_('Input directory <{0}> is not accessible: {1}').format(input_dir, e.strerror))
         else:
+            if not stat.S_ISDIR(mode):
+                gs.fatal(_('Input directory <{}> is not a directory').format(input_dir))
+
             self.input_dir = input_dir
 
-        if not os.path.exists(outdir):
-            os.makedirs(outdir)
-        else:
-            self.outdir = outdir
+        os.makedirs(outdir, exist_ok=True)
+        self.outdir = outdir
 
         # Create Pattern and find files --------------------------------------------------------------------------------
         self.extension = '.zip'
 
         if pattern:
-            filter_p = pattern + self.extension
+            filter_p = pattern + re.escape(self.extension)
         else:
-            filter_p = r'.*.' + self.extension
+            filter_p = '.*' + re.escape(self.extension)
 
         self.filter_p = filter_p
 
         gs.debug('Filter: {}'.format(filter_p), 1)
-        self.files = self.__filter(filter_p)
+        # Without a user pattern the extension check in __filter is sufficient.
+        self._pattern = re.compile(filter_p) if pattern else None
+        # The directory is walked lazily, when the files are needed for the first time.
+        self._files_iter_factory = self.__filter
+        self._files = None
+        self._scenes = {}
 
         # Self definitions ---------------------------------------------------------------------------------------------
-        self.t_srs = t_srs
         self.resolution_value = resolution_value
-        self.polarizations = polarizations
+        # pyroSAR receives the same types for every scene: a list of polarizations and a tuple of offsets.
+        if polarizations in ('all', None):
+            self.polarizations = list(_POLARIZATIONS)
+        elif isinstance(polarizations, str):
+            self.polarizations = [item.strip() for item in polarizations.split(',')]
+        else:
+            self.polarizations = list(polarizations)
+
         self.shapefile = shapefile
         self.scaling = scaling
         self.geocoding_type = geocoding_type
         self.removeS1BoderNoise = removeS1BoderNoise
-        self.offset = offset
+        self.offset = tuple(offset) if offset else None
         self.external_dem_file = external_dem_file
         self.external_dem_nan = external_dem_nan
         self.externalDEMApplyEGM = externalDEMApplyEGM
         self.basename_extensions = basename_extensions
         self.test = test
         self.verbose = verbose
+        self.jobs = max(1, int(jobs))
+        self.multilook = multilook
+        self.terrainFlattening = terrainFlattening
+        self.speckleFilter = speckleFilter
+        self.vrt_only = vrt_only
+        self.overwrite = overwrite
+
+    @property
+    def files(self):
+        if self._files is None:
+            # Unsupported or corrupt files are dropped before any SNAP process is launched for them.
+            self._scenes = self.__identify(self._files_iter_factory())
+            self._files = list(self._scenes)
+
+        return self._files
 
     # ------------------------------------------------------------------------------------------------------------------
     # Public Methods
@@ -421,18 +544,72 @@ class Geocode(object):
         -------
         None
         """
-        for infile in self.files:
-            sys.stdout.write('Start Time: {0} ----'.format(dt.datetime.utcnow().__str__()))
-            sys.stdout.write('Start Processing File: <{0}> {1}'.format(str(os.path.basename(infile)), os.linesep))
+        self.validate()
+
+        asyncio.run(self.geocode_async())
+
+    async def geocode_async(self):
+        """
+        Coroutine of the geocode process. Scenes of the same sensor, product, acquisition mode, date and orbit are
+        slice assembled in one SNAP run. At most `jobs` of these runs are processed at the same time.
+
+        Returns
+        -------
+        None
+        """
+        groups = self.__groups()
+        kwargs = self.__geocode_kwargs()
+
+        if self.external_dem_file is not None and not (self.test or self.vrt_only):
+            kwargs['externalDEMFile'] = self.__subset_dem(groups)
+
+        self._workflows = self.__workflows(groups, kwargs)
+        semaphore = asyncio.Semaphore(self.jobs)
+        workers = max(1, min(self.jobs, len(groups)))
 
-            geocode(infile, self.outdir, t_srs=self.t_srs, tr=self.resolution_value, polarizations=self.polarizations,
-                    shapefile=self.shapefile, scaling=self.scaling, geocoding_type=self.geocoding_type,
-                    removeS1BoderNoise=self.removeS1BoderNoise, offset=self.offset,
-                    externalDEMFile=self.external_dem_file, externalDEMNoDataValue=self.external_dem_nan,
-                    externalDEMApplyEGM=self.externalDEMApplyEGM, test=self.test)
+        if workers > 1:
+            _limit_snap_resources(workers)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            await asyncio.gather(*(self.__geocode_group(group, semaphore, executor, kwargs) for group in groups))
+
+    def validate(self):
+        """
+        Check all parameters before the geocoding process is started, so that an invalid parameter fails before any
+        SNAP process is launched.
 
-            sys.stdout.write('End Time: {0} ----'.format(dt.datetime.utcnow().__str__()))
-            sys.stdout.flush()
+        Raises
+        ------
+        ValueError
+            If any parameter is invalid.
+
+        Returns
+        -------
+        None
+        """
+        for directory in (self.input_dir, self.outdir):
+            if not os.path.isdir(directory):
+                raise ValueError("Directory <{0}> does not exist".format(directory))
+
+        if not os.access(self.outdir, os.W_OK):
+            raise ValueError("Directory <{0}> is not writable".format(self.outdir))
+
+        from osgeo import gdal, ogr
+
+        try:
+            _srs_from_epsg(int(self.t_srs))
+        except (TypeError, ValueError):
+            raise ValueError("EPSG code <{0}> is not valid".format(self.t_srs))
+
+        if self.external_dem_file is not None and gdal.Open(self.external_dem_file) is None:
+            raise ValueError("External DEM <{0}> can not be opened".format(self.external_dem_file))
+
+        if isinstance(self.shapefile, str) and ogr.Open(self.shapefile) is None:
+            raise ValueError("Shapefile <{0}> can not be opened".format(self.shapefile))
+
+        if self.offset is not None:
+            if len(self.offset) != 4 or not all(isinstance(item, int) for item in self.offset):
+                raise ValueError("Parameter offset must be four integers for left, right, top and bottom")
 
     def import_products(self, pattern=None, mapset=None, dbase=None, location=None, flags=None):
         """
@@ -455,7 +632,7 @@ class Geocode(object):
         -------
         None
         """
-        args = {'input': self.outdir, 'extension': 'GEOTIFF'}
+        args = {'input_dir': self.outdir, 'extension': '.tif'}
 
         if pattern:
             args['pattern'] = pattern
@@ -484,11 +661,9 @@ class Geocode(object):
 
         module = 'i.dr.import'
 
-        try:
-            gs.run_command(module, flags=flags, input_dir=self.outdir, **args)
-
-        except CalledModuleError as e:
-            pass
+        # All products are imported in one run. Parallel runs would share the session, the region and the lock of
+        # the mapset.
+        self.__import_products(module, flags, args)
 
     def print_products(self):
         """
@@ -498,39 +673,702 @@ class Geocode(object):
         -------
         None
         """
-        for f in self.files:
-            sys.stdout.write('Detected File <{0}> {1}'.format(str(f), os.linesep))
+        sys.stdout.writelines('Detected File <{0}> {1}'.format(f, os.linesep) for f in self._files_iter_factory())
 
     # ------------------------------------------------------------------------------------------------------------------
     # Private Methods
     # ------------------------------------------------------------------------------------------------------------------
-    def __filter(self, filter_p):
-        pattern = re.compile(filter_p)
-        files = []
-        for rec in os.walk(self.input_dir):
-            if not rec[-1]:
+    def __filter(self):
+        extension = self.extension
+        match = self._pattern.match if self._pattern is not None else None
+
+        for entry in _scandir_rec(self.input_dir):
+            if entry.name.endswith(extension) and (match is None or match(entry.name)):
+                yield entry.path
+
+    def __import_products(self, module, flags, args):
+        try:
+            from gscpy.i_import.i_dr_import import DirImport
+        except ImportError:
+            DirImport = None
+
+        if DirImport is None:
+            gs.run_command(module, flags=flags, **args)
+            return
+
+        # i.dr.import is available as package, so it runs in this interpreter instead of a new GRASS module process.
+        importer = DirImport(args['input_dir'], pattern=args['pattern'] or None, extension=args['extension'])
+
+        if 'c' in flags:
+            importer.create_mapset(mapset=args['mapset'], dbase=args['dbase'] or None,
+                                   location=args['location'] or None)
+
+        importer.import_products(reproject='r' in flags, link='l' in flags)
+
+    def __identify(self, files):
+        # Scenes are submitted while the directory is still walked. Until the pool has finished, the dict holds the
+        # futures of the scenes that are not in the cache.
+        cachedir = _cache_dir()
+        scenes = {}
+
+        with ProcessPoolExecutor() as executor:
+            for infile in files:
+                scene = _read_cache(_cache_path(cachedir, infile))
+                scenes[infile] = scene if scene is not None else executor.submit(_identify, infile)
+
+            for infile, scene in list(scenes.items()):
+                if not isinstance(scene, Future):
+                    continue
+
+                scene = scene.result()
+
+                if scene is None:
+                    gs.warning(_('File <{0}> is not a supported SAR scene and will be skipped').format(infile))
+                    del scenes[infile]
+                else:
+                    scenes[infile] = scene
+                    _write_cache(_cache_path(cachedir, infile), scene)
+
+        return scenes
+
+    def __groups(self):
+        groups = {}
+
+        for infile in self.files:
+            scene = self._scenes[infile]
+            # Only scenes of the same product and acquisition mode are slices of one another.
+            key = (scene.sensor, scene.product, scene.acquisition_mode, scene.start[:8], scene.orbitNumber_abs)
+            groups.setdefault(key, []).append(infile)
+
+        # pyroSAR sorts the slices by time and names the products after the first one. The marker and the skip check
+        # use the first file of a group, so the group is sorted the same way.
+        groups = [sorted(group, key=lambda item: self._scenes[item].start) for group in groups.values()]
+
+        # Largest groups first, so the longest SNAP runs are started early.
+        return sorted(groups, key=len, reverse=True)
+
+    async def __geocode_group(self, group, semaphore, executor, kwargs):
+        async with semaphore:
+            infile = group[0]
+            marker = self.__marker(infile)
+            name = ', '.join(os.path.basename(item) for item in group)
+
+            if not (self.test or self.vrt_only or self.overwrite) and self.__is_processed(group, marker):
+                log.info('Skip Processed File: <%s>', name)
+                return
+
+            if len(group) > 1:
+                scene = [self._scenes[item] for item in group]
+            else:
+                scene = self._scenes[infile]
+
+            log.info('Start Processing File: <%s>', name)
+            start = time.monotonic()
+
+            # The outputs of other parameters or of an outdated run are removed first, so none of their tiles and
+            # polarizations survives beside the new ones.
+            if not (self.test or self.vrt_only):
+                self.__remove_outputs(infile)
+
+            loop = asyncio.get_running_loop()
+
+            if self.vrt_only:
+                for item in group:
+                    outfile = os.path.join(self.outdir, self.__outname_base(item) + '.vrt')
+                    await loop.run_in_executor(None, _warp_vrt, item, outfile, self.t_srs)
+
+                log.info('End Processing File: <%s> (%.1f s)', name, time.monotonic() - start)
+                return
+
+            workflow = self._workflows.get(_workflow_key(scene)) if len(group) == 1 else None
+
+            # pyroSAR blocks until SNAP has finished, so it is moved to a worker process to overlap the scenes. A failed
+            # scene is reported and skipped, it must not cancel the other scenes of the run.
+            try:
+                if workflow is not None:
+                    await loop.run_in_executor(executor, _geocode_workflow, scene, self.outdir, workflow,
+                                               self.basename_extensions)
+                else:
+                    await loop.run_in_executor(executor, _geocode_one, scene, self.outdir, kwargs)
+            except Exception as e:
+                log.error('Failed Processing File: <%s> (%s: %s)', name, type(e).__name__, e)
+                return
+
+            if not self.test:
+                await loop.run_in_executor(None, self.__tile_outputs, infile)
+                self.__write_marker(marker)
+
+            log.info('End Processing File: <%s> (%.1f s)', name, time.monotonic() - start)
+
+    def __geocode_kwargs(self):
+        # pyroSAR receives the EPSG code itself, so the written products keep their EPSG identity.
+        kwargs = dict(t_srs=int(self.t_srs), tr=self.resolution_value, polarizations=self.polarizations,
+                      shapefile=self.shapefile, scaling=self.scaling, geocoding_type=self.geocoding_type,
+                      removeS1BoderNoise=self.removeS1BoderNoise, offset=self.offset,
+                      externalDEMFile=self.external_dem_file, externalDEMNoDataValue=self.external_dem_nan,
+                      externalDEMApplyEGM=self.externalDEMApplyEGM, test=self.test)
+
+        # Only deviations from the default chain are passed, so older pyroSAR versions without these
+        # parameters keep working.
+        if not self.multilook:
+            kwargs['rlks'] = 1
+            kwargs['azlks'] = 1
+
+        if not self.terrainFlattening:
+            kwargs['terrainFlattening'] = False
+
+        if self.speckleFilter:
+            kwargs['speckleFilter'] = self.speckleFilter
+
+        # The skip check expects the names pyroSAR writes, which only contain the extensions if they are passed on.
+        if self.basename_extensions:
+            kwargs['basename_extensions'] = self.basename_extensions
+
+        return kwargs
+
+    def __workflows(self, groups, kwargs):
+        # The SNAP graph only depends on the kind of scene, so pyroSAR builds it once per kind. A subset by shapefile
+        # or by offset depends on the scene geometry, in this case every scene is processed by pyroSAR itself.
+        workflows = {}
+
+        if self.test or self.vrt_only or self.shapefile is not None or self.offset is not None:
+            return workflows
+
+        from pyroSAR.snap.util import geocode
+
+        for group in groups:
+            if len(group) > 1:
                 continue
 
-            match = filter(pattern.match, rec[-1])
-            if match is None:
+            scene = self._scenes[group[0]]
+            key = _workflow_key(scene)
+
+            # The border noise that pyroSAR removes is not part of the graph.
+            if key in workflows or (self.removeS1BoderNoise and _has_border_noise(scene)):
                 continue
 
-            for f in match:
-                if f.endswith(self.extension):
-                    files.append(os.path.join(rec[0], f))
+            tmpdir = tempfile.mkdtemp(dir=self.outdir)
+            try:
+                geocode(scene, tmpdir, **dict(kwargs, test=True))
+                xmlfiles = glob.glob(os.path.join(tmpdir, '*.xml'))
+
+                if len(xmlfiles) != 1:
+                    continue
+
+                root = ET.parse(xmlfiles[0]).getroot()
+
+                if root.find(_READ_FILE) is not None and root.find(_WRITE_FILE) is not None:
+                    workflows[key] = {'xml': ET.tostring(root), 'outdir': tmpdir,
+                                      'basename': scene.outname_base(extensions=self.basename_extensions)}
+            finally:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+
+        return workflows
+
+    def __subset_dem(self, groups):
+        # SNAP reads the external DEM anew for every scene. The DEM is cut once to the footprint of all scenes, so
+        # every run only reads the part it needs. The subset is kept in the cache directory, which is not scanned by
+        # the import, and reused by the next runs.
+        extents = []
+
+        for group in groups:
+            for infile in group:
+                with self._scenes[infile].bbox() as bbox:
+                    extents.append(bbox.extent)
+
+        if not extents:
+            return self.external_dem_file
+
+        extent = (min(item['xmin'] for item in extents) - _DEM_BUFFER,
+                  max(item['ymax'] for item in extents) + _DEM_BUFFER,
+                  max(item['xmax'] for item in extents) + _DEM_BUFFER,
+                  min(item['ymin'] for item in extents) - _DEM_BUFFER)
+
+        filename = os.path.abspath(self.external_dem_file)
+        parameter = (filename, os.path.getmtime(filename), tuple(round(item, 6) for item in extent))
+        digest = hashlib.blake2b(repr(parameter).encode('utf-8'), digest_size=8).hexdigest()
+        outfile = os.path.join(self.outdir, '.pyrosar_cache', 'dem', digest + '.tif')
+
+        if not os.path.exists(outfile):
+            os.makedirs(os.path.dirname(outfile), exist_ok=True)
+            _subset_dem(filename, outfile, extent)
+
+        return outfile
+
+    def __tile_outputs(self, infile):
+        for item in glob.glob(os.path.join(self.outdir, self.__outname_base(infile) + '*.tif')):
+            _tile_geotiff(item)
+
+    def __marker(self, infile):
+        """
+        Path of the sidecar file that marks a scene as processed with the current parameters. Changing any
+        parameter changes the digest in the file name, so the scene is processed again and its old outputs are
+        removed.
+        """
+        parameter = (self.t_srs, self.resolution_value, self.polarizations, self.shapefile, self.scaling,
+                     self.geocoding_type, self.removeS1BoderNoise, self.offset, self.external_dem_file,
+                     self.external_dem_nan, self.externalDEMApplyEGM, self.basename_extensions, self.multilook,
+                     self.terrainFlattening, self.speckleFilter)
+        digest = hashlib.blake2b(repr(parameter).encode('utf-8'), digest_size=8).hexdigest()
 
-        return files
+        return os.path.join(self.outdir, '.{0}.{1}'.format(self.__outname_base(infile), digest))
 
-    def __raster_epsg(self, filename):
-        dsn = gdal.Open(filename)
+    def __remove_outputs(self, infile):
+        basename = self.__outname_base(infile)
+        outputs = glob.glob(os.path.join(self.outdir, basename + '*'))
+        markers = glob.glob(os.path.join(self.outdir, '.' + basename + '.*'))
 
-        srs = osr.SpatialReference()
-        srs.ImportFromWkt(dsn.GetProjectionRef())
+        for item in outputs + markers:
+            if os.path.isfile(item):
+                os.remove(item)
 
-        ret = srs.GetAuthorityCode(None)
-        dsn = None
+    def __outname_base(self, infile):
+        return self._scenes[infile].outname_base(extensions=self.basename_extensions)
 
-        return ret
+    def __write_marker(self, marker):
+        # The marker is moved into place after all outputs and tiles are written, so an interrupted run never leaves
+        # a marker beside incomplete outputs.
+        fd, tmp = tempfile.mkstemp(dir=self.outdir)
+        os.close(fd)
+        os.replace(tmp, marker)
+
+    def __is_processed(self, group, marker):
+        basename = self.__outname_base(group[0])
+        mtime = max(os.path.getmtime(item) for item in group)
+
+        if os.path.exists(marker):
+            outputs = glob.glob(os.path.join(self.outdir, basename + '*.tif'))
+
+            return bool(outputs) and all(os.path.getmtime(item) >= mtime for item in outputs)
+
+        # A marker of other parameters means that the outputs are outdated.
+        if glob.glob(os.path.join(self.outdir, '.' + basename + '.*')):
+            return False
+
+        # Outputs without any marker were written by an earlier run or by hand. They are kept only if every
+        # polarization is present, otherwise the run was interrupted.
+        polarizations = [item for item in self.polarizations if item in self._scenes[group[0]].polarizations]
+        outputs = [glob.glob(os.path.join(self.outdir, '{0}_{1}*.tif'.format(basename, item)))
+                   for item in polarizations]
+
+        return bool(outputs) and all(outputs) and all(os.path.getmtime(item) >= mtime
+                                                      for items in outputs for item in items)
+
+def _scandir_rec(path):
+    """
+    Walk a directory tree with os.scandir. The entry types are taken from the directory listing, so no stat call is
+    needed per entry. Symbolic links to directories are not followed.
+
+    Parameters
+    ----------
+    path : str
+        Root directory.
+
+    Returns
+    -------
+    generator of os.DirEntry
+        All entries that are not directories.
+    """
+    stack = [path]
+
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    yield entry
+
+
+@functools.lru_cache(maxsize=64)
+def _raster_epsg(filename):
+    """
+    EPSG code of a georeferenced raster file. The result is cached, so every file is opened only once.
+
+    Parameters
+    ----------
+    filename : str
+        Absolute path to the raster file.
+
+    Returns
+    -------
+    int
+    """
+    from osgeo import gdal, osr
+
+    dsn = gdal.Open(filename)
+
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(dsn.GetProjectionRef())
+
+    ret = srs.GetAuthorityCode(None)
+    dsn = None
+    srs = None
+
+    if ret is None:
+        raise ValueError("File <{0}> has no EPSG code".format(filename))
+
+    return int(ret)
+
+
+@functools.lru_cache(maxsize=64)
+def _srs_from_epsg(epsg):
+    """
+    Spatial reference of an EPSG code. The result is cached and must not be modified.
+
+    Parameters
+    ----------
+    epsg : int
+        EPSG code.
+
+    Returns
+    -------
+    osr.SpatialReference
+    """
+    from osgeo import osr
+
+    srs = osr.SpatialReference()
+
+    if srs.ImportFromEPSG(epsg) != 0:
+        raise ValueError("EPSG code <{0}> is not valid".format(epsg))
+
+    return srs
+
+
+def _geocode_one(scene, outdir, kwargs):
+    """
+    Geocode a scene or a group of scenes with pyroSAR. This function is executed in the worker processes.
+
+    Parameters
+    ----------
+    scene : pyroSAR.drivers.ID or list
+        The scene or the scenes to be slice assembled.
+    outdir : str
+        The directory to write the final files to.
+    kwargs : dict
+        Keyword arguments of :func:`pyroSAR.snap.util.geocode`.
+
+    Returns
+    -------
+    None
+    """
+    from pyroSAR.snap.util import geocode
+
+    geocode(scene, outdir, **kwargs)
+
+
+def _workflow_key(scene):
+    """
+    Key of the scenes that share the same SNAP workflow.
+
+    Parameters
+    ----------
+    scene : pyroSAR.drivers.ID
+        The scene.
+
+    Returns
+    -------
+    tuple
+    """
+    return (scene.sensor, scene.product, scene.acquisition_mode, tuple(sorted(scene.polarizations)),
+            _has_border_noise(scene))
+
+
+def _has_border_noise(scene):
+    """
+    Check whether pyroSAR removes the border noise of a Sentinel-1 GRD scene, which depends on the IPF version the
+    scene was processed with.
+
+    Parameters
+    ----------
+    scene : pyroSAR.drivers.ID
+        The scene.
+
+    Returns
+    -------
+    bool
+    """
+    if not scene.sensor.startswith('S1') or scene.product != 'GRD':
+        return False
+
+    try:
+        return float(scene.meta['IPF_version']) < _IPF_BORDER_NOISE
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return True
+
+
+def _geocode_workflow(scene, outdir, workflow, basename_extensions=None):
+    """
+    Geocode a scene with a SNAP workflow that pyroSAR built for another scene of the same kind. The input file of the
+    Read node and the output file of the Write node are replaced. Like pyroSAR, the orbit file is chosen per scene:
+    the precise orbit if it is available, the restituted orbit otherwise. This function is executed in the worker
+    processes.
+
+    Parameters
+    ----------
+    scene : pyroSAR.drivers.ID
+        The scene.
+    outdir : str
+        The directory to write the final files to.
+    workflow : dict
+        The workflow xml, the output directory and the basename of the scene the workflow was built for.
+    basename_extensions: list of str
+        Names of additional parameters to append to the basename.
+
+    Returns
+    -------
+    None
+    """
+    from pyroSAR.snap.auxil import gpt
+
+    root = ET.fromstring(workflow['xml'])
+    read = root.find(_READ_FILE)
+    write = root.find(_WRITE_FILE)
+    basename = scene.outname_base(extensions=basename_extensions)
+
+    read.text = scene.scene
+    write.text = write.text.replace(workflow['outdir'], outdir).replace(workflow['basename'], basename)
+
+    orbit = root.find(_ORBIT_TYPE)
+
+    if orbit is not None and orbit.text in _ORBIT_TYPES.values():
+        osv_type = 'POE' if scene.getOSV(osvType='POE', returnMatch=True) is not None else 'RES'
+
+        if osv_type == 'RES':
+            scene.getOSV(osvType='RES')
+
+        orbit.text = _ORBIT_TYPES[osv_type]
+
+    xmlfile = os.path.join(outdir, basename + '_proc.xml')
+    ET.ElementTree(root).write(xmlfile)
+
+    gpt(xmlfile)
+
+
+def _limit_snap_resources(workers):
+    """
+    Split the physical memory and the processor cores between the SNAP JVMs of parallel workers, so they neither
+    run out of memory nor oversubscribe the cores together. The limits are appended to _JAVA_OPTIONS, unless the
+    user already set the same option there.
+
+    Parameters
+    ----------
+    workers : int
+        Number of SNAP processes running at the same time.
+
+    Returns
+    -------
+    None
+    """
+    # Option name and value of every limit.
+    limits = [('-Dsnap.parallelism=', max(1, (os.cpu_count() or 1) // workers))]
+
+    try:
+        memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, OSError, ValueError):
+        pass
+    else:
+        limits.append(('-Xmx', '{0}m'.format(int(memory * 0.75 / workers) // 1024 ** 2)))
+
+    java_options = os.environ.get('_JAVA_OPTIONS', '').split()
+
+    for name, value in limits:
+        if not any(item.startswith(name) for item in java_options):
+            java_options.append('{0}{1}'.format(name, value))
+
+    os.environ['_JAVA_OPTIONS'] = ' '.join(java_options)
+
+
+def _identify(filename):
+    """
+    Identify a SAR scene with pyroSAR.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the scene.
+
+    Returns
+    -------
+    pyroSAR.drivers.ID or None
+        None if the scene is not supported by pyroSAR.
+    """
+    from pyroSAR import identify
+
+    # pyroSAR raises RuntimeError for unknown files, but a corrupt archive also fails with OSError, ValueError or
+    # errors of the zip and xml parsers.
+    try:
+        return identify(filename)
+    except Exception:
+        return None
+
+
+def _tile_geotiff(filename):
+    """
+    Rewrite a GeoTIFF in place as tiled and compressed GeoTIFF.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the GeoTIFF.
+
+    Returns
+    -------
+    None
+    """
+    from osgeo import gdal
+
+    tmp = filename + '.tmp'
+
+    dsn = gdal.Translate(tmp, filename, options=gdal.TranslateOptions(format='GTiff', creationOptions=_TILE_OPTIONS))
+    dsn = None
+
+    os.replace(tmp, filename)
+
+
+def _subset_dem(filename, outfile, extent):
+    """
+    Cut a DEM to an extent and write it as tiled GeoTIFF, which SNAP can read as external DEM.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the DEM.
+    outfile : str
+        Path to the subset.
+    extent : tuple
+        Upper left and lower right corner (xmin, ymax, xmax, ymin) in EPSG:4326.
+
+    Returns
+    -------
+    None
+    """
+    from osgeo import gdal
+
+    tmp = outfile + '.tmp'
+
+    dsn = gdal.Translate(tmp, filename, options=gdal.TranslateOptions(format='GTiff', projWin=list(extent),
+                                                                      projWinSRS='EPSG:4326',
+                                                                      creationOptions=_DEM_OPTIONS))
+    dsn = None
+
+    os.replace(tmp, outfile)
+
+
+def _warp_vrt(filename, outfile, t_srs):
+    """
+    Write a VRT that warps a zipped Sentinel-1 scene with its ground control points into a target reference system.
+    No pixels are processed until the VRT is read.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the zipped SAFE scene.
+    outfile : str
+        Path to the VRT file.
+    t_srs : int
+        Target EPSG code.
+
+    Returns
+    -------
+    None
+    """
+    from osgeo import gdal
+
+    safe = os.path.splitext(os.path.basename(filename))[0] + '.SAFE'
+    src = '/vsizip/' + os.path.join(filename, safe, 'manifest.safe')
+
+    dsn = gdal.Warp(outfile, src, options=gdal.WarpOptions(format='VRT', dstSRS='EPSG:{0}'.format(t_srs)))
+    dsn = None
+
+
+def _cache_dir():
+    """
+    Per-user directory of the scene cache. The cached scenes are loaded with pickle, so the cache is kept out of the
+    output directory, which other users may be able to write to.
+
+    Returns
+    -------
+    str
+    """
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+
+    return os.path.join(root, 'gscpy', 'scenes')
+
+
+def _cache_path(cachedir, filename):
+    """
+    Path of the cache file of a scene. The key contains the modification time and the size of the scene, so a changed
+    file is identified again. The files are spread over subdirectories named after the first two hex digits of the key.
+
+    Parameters
+    ----------
+    cachedir : str
+        Root directory of the cache.
+    filename : str
+        Path to the scene.
+
+    Returns
+    -------
+    str
+    """
+    status = os.stat(filename)
+    key = '{0}:{1}:{2}'.format(os.path.abspath(filename), status.st_mtime, status.st_size)
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+
+    return os.path.join(cachedir, digest[:2], digest + '.pkl')
+
+
+def _read_cache(path):
+    """
+    Read a cached object.
+
+    Parameters
+    ----------
+    path : str
+        Path to the cache file.
+
+    Returns
+    -------
+    object or None
+        None if the file does not exist or can not be read.
+    """
+    # A file written by another pyroSAR or gscpy version may fail with any error, e.g. an AttributeError for a class
+    # that no longer exists. The scene is identified again in this case.
+    try:
+        with open(path, 'rb') as fp:
+            return pickle.load(fp)
+    except Exception:
+        return None
+
+
+def _write_cache(path, value):
+    """
+    Write an object to the cache.
+
+    Parameters
+    ----------
+    path : str
+        Path to the cache file.
+    value : object
+        Object to be cached.
+
+    Returns
+    -------
+    None
+    """
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+
+    with open(path, 'wb') as fp:
+        pickle.dump(value, fp)
+
+
+# Default values of the GRASS options that are not set by the user.
+_DEFAULTS = {'resolution_value': 20, 'polarizations': 'all', 'geocoding_type': 'Range-Doppler',
+             'jobs': 1}
+
+# Translate the GRASS option values of geocoding_type to the names that pyroSAR expects.
+_GEOCODING_TYPES = {'Range-Doppler': 'Range-Doppler', 'Cross-Correlation': 'SAR simulation cross correlation'}
 
 
 def change_dict_value(dictionary, old_value, new_value):
@@ -549,28 +1387,27 @@ def change_dict_value(dictionary, old_value, new_value):
     Returns
     -------
     dict
+        A new dictionary, the input is not modified.
     """
-    for key, value in dictionary.items():
-        if value == old_value:
-            dictionary[key] = new_value
-
-    return dictionary
+    return {key: (new_value if value == old_value else value) for key, value in dictionary.items()}
 
 
 def main():
-    if options['t_srs'] is None:
-        options['t_srs'] = 4326
-    else:
-        options['t_srs'] = int(options['t_srs'])
+    for key, default in _DEFAULTS.items():
+        if options[key] is None:
+            options[key] = default
 
-    if options['resolution_value'] is None:
-        options['resolution_value'] = 20
+    # The default EPSG code only applies if no georeferenced file is given.
+    if options['t_srs'] is not None:
+        options['t_srs'] = int(options['t_srs'])
+    elif options['t_srs_file'] is None:
+        options['t_srs'] = 4326
 
-    if options['geocoding_type'] is 'Cross-Correlation':
-        options['geocoding_type'] = 'SAR simulation cross correlation'
+    if options['external_dem_nan'] is not None:
+        options['external_dem_nan'] = int(options['external_dem_nan'])
 
-    if options['polarizations'] is None:
-        options['polarizations'] = 'all'
+    options['resolution_value'] = float(options['resolution_value'])
+    options['geocoding_type'] = _GEOCODING_TYPES.get(options['geocoding_type'], options['geocoding_type'])
 
     if options['offset'] is not None:
         offset_list = options['offset'].split(',')
@@ -578,12 +1415,16 @@ def main():
         options['offset'] = tuple(offset_list)
 
     pp_geocode = Geocode(input_dir=options['input_dir'], outdir=options['outdir'], pattern=options['pattern'],
-                         t_srs=options['t_srs'], resolution_value=options['resolution_value'],
+                         t_srs=options['t_srs'], t_srs_from_file=options['t_srs_file'],
+                         resolution_value=options['resolution_value'],
                          polarizations=options['polarizations'], shapefile=options['shapefile'],
                          scaling=options['scaling'], geocoding_type=options['geocoding_type'],
                          removeS1BoderNoise=flags['b'], offset=options['offset'],
                          external_dem_file=options['external_dem_file'], external_dem_nan=options['external_dem_nan'],
-                         externalDEMApplyEGM=flags['e'], test=flags['t'])
+                         externalDEMApplyEGM=flags['e'], test=flags['t'], jobs=options['jobs'],
+                         multilook=not flags['m'], terrainFlattening=not flags['n'],
+                         speckleFilter=options['speckle_filter'] or False, vrt_only=flags['w'],
+                         overwrite=gs.overwrite())
 
     if flags['p']:
         pp_geocode.print_products()
@@ -592,26 +1433,17 @@ def main():
     pp_geocode.geocode()
 
     if flags['i']:
-        pattern = options['pattern']
-        mapset = options['mapset']
-        dbase = options['dbase']
-        location = options['location']
-
-        flag = ''
-        flag_list = ['c', 'r', 'l']
-
-        for item in flag_list:
-            if flags[item]:
-                flag += item
-            else:
-                pass
+        flag = ''.join(item for item in ('c', 'r', 'l') if flags[item])
 
-        pp_geocode.import_products(pattern=pattern, mapset=mapset, dbase=dbase, location=location, flags=flags)
+        pp_geocode.import_products(pattern=options['pattern'], mapset=options['mapset'], dbase=options['dbase'],
+                                   location=options['location'], flags=flag)
 
     return 0
 
 
 if __name__ == "__main__":
     options, flags = gs.parser()
+    logging.basicConfig(format='%(asctime)s %(message)s', stream=sys.stdout,
+                        level=logging.WARNING if gs.verbosity() == 0 else logging.INFO)
     options = change_dict_value(options, '', None)
     sys.exit(main())
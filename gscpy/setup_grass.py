@@ -2,6 +2,7 @@
 Script to load GRASS GIS out of GRASS GIS environment.
 """
 import os
+import shutil
 import sys
 import subprocess
 
@@ -10,6 +11,10 @@ import subprocess
 # --------------------------------------------------------------------------------------------------
 # Define path to GRASS GIS launch skript -------------------------------------------------------
 grass7bin_win = 'C:\\Program Files\\QGIS 2.18\\bin\\grass72.bat'
+grass7bin_names = ['grass74', 'grass72', 'grass7', 'grass']
+
+# The GISBASE found by the launch script is stored here, so the script only runs once.
+gisbase_cache = os.path.join(os.path.expanduser("~"), '.gscpy_gisbase')
 
 # DATA -----------------------------------------------------------------------------------------
 # define GRASS DATABASE
@@ -17,22 +22,38 @@ gisdb = "C:\\newLocation\\PERMANENT"
 # gisdb = os.path.join(os.path.expanduser("~"), "grassdata")
 
 # GRASS GIS SOFTWARE ---------------------------------------------------------------------------
-startcmd = [grass7bin_win, '--config', 'path']
+gisbase = os.environ.get('GSCPY_GISBASE')
+
+if gisbase is None and os.path.isfile(gisbase_cache):
+    with open(gisbase_cache) as cache:
+        gisbase = cache.read().strip()
+
+if gisbase is None or not os.path.isdir(gisbase):
+    if sys.platform.startswith('win'):
+        grass7bin = grass7bin_win
+    else:
+        grass7bin = next((item for item in map(shutil.which, grass7bin_names) if item is not None), None)
+
+    if grass7bin is None:
+        print("ERROR: Cannot find GRASS GIS 7 start script ({0})".format(', '.join(grass7bin_names)),
+              file=sys.stderr)
+        sys.exit(-1)
+
+    startcmd = [grass7bin, '--config', 'path']
 
-p = subprocess.Popen(startcmd, shell=False,
-                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-out, err = p.communicate()
+    p = subprocess.run(startcmd, capture_output=True, text=True)
 
-if p.returncode != 0:
-    print >>sys.stderr, "ERROR: Cannot find GRASS GIS 7 start script (%s)" % startcmd
-    sys.exit(-1)
+    if p.returncode != 0:
+        print("ERROR: Cannot find GRASS GIS 7 start script ({0})".format(startcmd), file=sys.stderr)
+        sys.exit(-1)
 
-if isinstance(out, bytes):
-    out = out.decode('utf-8')
-else:
-    pass
+    gisbase = p.stdout.strip('\n\r')
 
-gisbase = out.strip('\n\r')
+    try:
+        with open(gisbase_cache, 'w') as cache:
+            cache.write(gisbase)
+    except OSError:
+        pass
 
 # Environmental Variables -----------------------------------------------------------------------
 # Set GISBASE environment variable
@@ -1,4 +1,4 @@
-#! /usr/bin/python2
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 ############################################################################
 #
@@ -182,8 +182,10 @@
 #%end
 
 
+import functools
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     import grass.script as gs
@@ -191,12 +193,13 @@ try:
 except ImportError:
     raise ImportError("You have to install GRASS GIS to run this program.")
 
+# t.create and t.register are thin wrappers around the temporal framework. Calling it directly creates and
+# registers the dataset in this process, instead of starting two modules that each connect to the database.
 try:
-    from osgeo import gdal, osr
-except ImportError as e:
-    gs.fatal(_("Flag -r requires GDAL library: {}").format(e))
-
-    raise ImportError("You have to install GRASS GIS to run this program.")
+    import grass.temporal as tgis
+    from grass.exceptions import FatalError
+except ImportError:
+    tgis = None
 
 
 class CRegister(object):
@@ -248,6 +251,8 @@ class CRegister(object):
         Attributes for t.create module.
     rkwargs : dict
         Attributes for t.register module.
+    files : list
+        Detected maps. g.list is called on the first access.
 
     Methods
     -------
@@ -257,6 +262,8 @@ class CRegister(object):
         Print all detected files.
     list()
         List Files for current space time dataset.
+    invalidate_list_cache()
+        Clear the cached results of g.list.
     plot()
         Visualize the temporal extents of the dataset.
 
@@ -314,41 +321,34 @@ class CRegister(object):
 
         # Initialise Kwargs --------------------------------------------------------------------------------------------
         # < t.create > ------------
-        create_input_parameter = [output, temporaltype, title, description]
-        __CREATE_KEYS__ = ["output", "temporaltype", "title", "description"]
-
-        self.ckwargs = {}
-
-        for i, item in enumerate(create_input_parameter):
-            if item is not None:
-                self.ckwargs[__CREATE_KEYS__[i]] = item
+        self.ckwargs = {key: value for key, value in zip(("output", "temporaltype", "title", "description"),
+                                                        (output, temporaltype, title, description))
+                        if value is not None}
 
         self.ckwargs['type'] = 'strds'
 
         # < g.list > ------------
-        list_input_parameter = [type, separator, pattern, exclude, mapset, region]
-        __LIST_KEYS__ = ["type", "separator", "pattern", "exclude", "mapset", "region"]
-
-        self.lkwargs = {}
-
-        for i, item in enumerate(list_input_parameter):
-            if item is not None:
-                self.lkwargs[__LIST_KEYS__[i]] = item
+        self.lkwargs = {key: value for key, value in zip(("type", "separator", "pattern", "exclude", "mapset",
+                                                         "region"),
+                                                        (type, separator, pattern, exclude, mapset, region))
+                        if value is not None}
 
         # < t.register > ------------
-        register_input_parameter = [self.input, type, start, unit, increment]
-        __REG_KEYS__ = ["input", "type", "start", "unit", "increment"]
-
-        self.rkwargs = {}
+        self.rkwargs = {key: value for key, value in zip(("input", "type", "start", "unit", "increment"),
+                                                        (self.input, type, start, unit, increment))
+                        if value is not None}
 
-        for i, item in enumerate(register_input_parameter):
-            if item is not None:
-                self.rkwargs[__REG_KEYS__[i]] = item
+        # Create Pattern and find files --------------------------------------------------------------------------------
+        # The maps are listed when they are needed for the first time, so cregister can overlap it with t.create.
+        self._files = None
 
-        self.rkwargs['maps'] = self.__list_files()
+    @property
+    def files(self):
+        if self._files is None:
+            self._files = self.__list_files()
+            self.rkwargs['maps'] = self._files
 
-        # Create Pattern and find files --------------------------------------------------------------------------------
-        self.files = self.rkwargs['maps']
+        return self._files
 
     # ------------------------------------------------------------------------------------------------------------------
     # Public Methods
@@ -366,8 +366,42 @@ class CRegister(object):
         -------
         None
         """
-        self.__t_create()
-        self.__t_register(t)
+        if tgis is not None:
+            tgis.init(raise_fatal_error=True)
+            create = functools.partial(tgis.open_new_stds, self.ckwargs['output'], self.ckwargs['type'],
+                                       self.ckwargs.get('temporaltype'), self.ckwargs.get('title'),
+                                       self.ckwargs.get('description'), self.semantictype, None, gs.overwrite())
+            error = FatalError
+        else:
+            create = functools.partial(gs.run_command, 't.create', **self.ckwargs)
+            error = CalledModuleError
+
+        # The dataset is created while g.list runs. Both wait on the database or on another process. A dataset that
+        # could not be created, e.g. because it exists and --overwrite is not set, stops the module before any map is
+        # registered.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(create)
+            files = self.files
+
+            try:
+                future.result()
+            except error as e:
+                gs.fatal(_('Space time dataset <{0}> could not be created: {1}').format(self.output, e))
+
+        # Without any map t.register would only fail.
+        if not files:
+            return 0
+
+        try:
+            if tgis is not None:
+                tgis.register_maps_in_space_time_dataset(self.rkwargs['type'], self.rkwargs['input'],
+                                                         maps=','.join(files), start=self.rkwargs.get('start'),
+                                                         unit=self.rkwargs.get('unit'),
+                                                         increment=self.rkwargs.get('increment'), interval=t)
+            else:
+                gs.run_command('t.register', flags='i' if t else '', **self.rkwargs)
+        except error:
+            pass
 
         return 0
 
@@ -379,9 +413,7 @@ class CRegister(object):
         -------
         None
         """
-        for f in self.files:
-            sys.stdout.write(
-                'Detected File <{0}> {1}'.format(str(f), os.linesep))
+        sys.stdout.writelines('Detected File <{0}> {1}'.format(f, os.linesep) for f in self.files)
 
         return 0
 
@@ -402,6 +434,17 @@ class CRegister(object):
 
         return 0
 
+    @classmethod
+    def invalidate_list_cache(cls):
+        """
+        Clear the cached results of g.list, so that the next instance lists the maps again.
+
+        Returns
+        -------
+        None
+        """
+        _list_maps.cache_clear()
+
     def plot(self):
         """
         Visualize the temporal extents of the dataset.
@@ -422,103 +465,57 @@ class CRegister(object):
     # Private Methods
     # ------------------------------------------------------------------------------------------------------------------
     def __list_files(self, i=False, r=False, e=False, t=False, m=False, f=False):
-        raw_files = self.__list_files(i, r, e, t, m, f)
-
-        files = list()
-        for item in raw_files.keys():
-            files.append(item.encode("utf-8"))
-
-        if files is []:
-            gs.message(_('No files detected.'))
-            return
-
-        return files
-
-    def __maps(self, module, kwargs):
-        maps = module + ' '
-        for i, (keys, values) in enumerate(kwargs.items()):
-            if i < len(kwargs) - 1:
-                maps += keys + '=' + values + ' '
-            else:
-                maps += keys + '=' + values + ' --quiet'
-
-        return '`' + maps + '`'
-
-    def __t_create(self):
-        module = 't.create'
-
-        try:
-            gs.run_command(module, **self.ckwargs)
-
-        except CalledModuleError as e:
-            pass
-
-        return 0
-
-    def __t_register(self, t=False):
-        module = 't.register'
-        if t:
-            flags = 'i'
-        else:
-            flags = ''
+        module = "g.list"
+        flag = ''.join(name for name, value in zip('iretmf', (i, r, e, t, m, f)) if value)
 
         try:
-            gs.run_command(module, flags=flags, **self.rkwargs)
+            raw_files = _list_maps(module, flag, tuple(sorted(self.lkwargs.items())))
 
         except CalledModuleError as e:
-            pass
+            raw_files = {}
 
-        return 0
+        files = list(raw_files)
 
-    def __list_files(self, i=False, r=False, e=False, t=False, m=False, f=False):
-        module = "g.list"
-        flag = ''
-        flag_list = [i, r, e, t, m, f]
-        __FLAG__ = ["i", "r", "e", "t", "m", "f"]
-
-        for i, item in enumerate(flag_list):
-            if item:
-                flag += __FLAG__[i]
+        if not files:
+            gs.message(_('No files detected.'))
+            return []
 
-        try:
-            return gs.parse_command(module, flags=flag, **self.lkwargs)
+        return files
 
-        except CalledModuleError as e:
-            pass
 
-        return 0
-
-def change_dict_value(dictionary, old_value, new_value):
+@functools.lru_cache(maxsize=128)
+def _list_maps(module, flag, kwargs):
     """
-    Change a certain value from a dictionary.
+    List maps with g.list. The result is cached for every combination of flags and options, so the same listing
+    only starts one GRASS module per session.
 
     Parameters
     ----------
-    dictionary : dict
-        Input dictionary.
-    old_value : str, NoneType, bool
-        The value to be changed.
-    new_value : str, NoneType, bool
-        Replace value.
+    module : str
+        Name of the list module.
+    flag : str
+        Flags of the module.
+    kwargs : tuple
+        Sorted (key, value) pairs of the module options.
 
     Returns
     -------
-    dict
+    tuple of str
+        Names of the maps.
     """
-    for key, value in dictionary.items():
-        if value == old_value:
-            dictionary[key] = new_value
+    return tuple(gs.parse_command(module, flags=flag, **dict(kwargs)))
+
 
-    return dictionary
+# Default values of the GRASS options that are not set by the user.
+_DEFAULTS = {'type': 'raster', 'semantictype': 'mean', 'separator': 'comma', 'temporaltype': 'absolute'}
+
+# GRASS options that are passed to CRegister under the same name.
+_CREGISTER_OPTIONS = ('output', 'title', 'description', 'semantictype', 'type', 'start', 'end', 'temporaltype',
+                      'separator', 'pattern', 'exclude', 'mapset', 'region', 'unit', 'increment')
 
 
 def main():
-    cregister = CRegister(output=options['output'], title=options['title'], description=options['description'],
-                          semantictype=options['semantictype'], type=options['type'], start=options['start'],
-                          end=options['end'], temporaltype=options['temporaltype'],
-                          separator=options['separator'], pattern=options['pattern'], exclude=options['exclude'],
-                          mapset=options['mapset'], region=options['region'],
-                          unit=options['unit'], increment=options['increment'])
+    cregister = CRegister(**{key: options[key] for key in _CREGISTER_OPTIONS})
 
     # print cregister.rkwargs
 
@@ -539,18 +536,7 @@ def main():
 
 if __name__ == "__main__":
     options, flags = gs.parser()
-    options = change_dict_value(options, '', None)
-    if options['type'] is None:
-        options['type'] = 'raster'
-
-    if options['semantictype'] is None:
-        options['semantictype'] = 'mean'
-
-    if options['separator'] is None:
-        options['separator'] = 'comma'
-
-    if options['temporaltype'] is None:
-        options['temporaltype'] = 'absolute'
-
+    # Empty options are set to their default or to None in one pass.
+    options = {key: (_DEFAULTS.get(key) if value in ('', None) else value) for key, value in options.items()}
 
     sys.exit(main())
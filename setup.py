@@ -1,4 +1,6 @@
 # -*- coding: UTF-8 -*-
+import ast
+import re
 
 try:
     from setuptools import setup
@@ -10,17 +12,15 @@ from setuptools import find_packages
 
 
 def get_packages():
-    find_packages(exclude=['docs', 'tests']),
-    return find_packages()
+    return find_packages(exclude=['docs', 'tests'])
 
 
 def get_version():
-    version = dict()
-
+    # The version is read from version_info without executing the file.
     with open("gscpy/__version__.py") as fp:
-        exec (fp.read(), version)
+        match = re.search(r'^version_info\s*=\s*(\(.*\))', fp.read(), re.M)
 
-    return version['__version__']
+    return '.'.join(map(str, ast.literal_eval(match.group(1))))
 
 
 setup(name='gscpy',
@@ -52,12 +52,16 @@ setup(name='gscpy',
           # Pick your license as you wish (should match "license" above)
           'License :: OSI Approved :: MIT License',
 
-          'Programming Language :: Python :: 2.7',
+          'Programming Language :: Python :: 3',
+          'Programming Language :: Python :: 3 :: Only',
+          'Programming Language :: Python :: 3.7',
           'Operating System :: Microsoft',
 
       ],
       # package_data={"": ["*.txt"]},
       include_package_data=True,
+      # asyncio.run and subprocess.run(capture_output=...) need Python 3.7.
+      python_requires='>=3.7',
       install_requires=['numpy', 'scipy'],
       setup_requires=[
           'pytest-runner',
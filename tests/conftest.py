@@ -0,0 +1,207 @@
+import builtins
+import os
+import sys
+import types
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The modules are GRASS scripts. Outside of a GRASS session the parts of grass.script they use at import time and in
+# the tested code paths are replaced by a minimal module.
+try:
+    import grass.script
+except ImportError:
+    class CalledModuleError(Exception):
+        pass
+
+    class FatalError(Exception):
+        pass
+
+    def fatal(msg):
+        raise FatalError(msg)
+
+    grass = types.ModuleType('grass')
+    script = types.ModuleType('grass.script')
+    exceptions = types.ModuleType('grass.exceptions')
+
+    exceptions.CalledModuleError = CalledModuleError
+    exceptions.FatalError = FatalError
+
+    script.fatal = fatal
+    script.warning = script.message = lambda msg: None
+    script.debug = lambda msg, debug=1: None
+    script.overwrite = lambda: False
+
+    grass.script = script
+    grass.exceptions = exceptions
+
+    sys.modules.update({'grass': grass, 'grass.script': script, 'grass.exceptions': exceptions})
+
+if not hasattr(builtins, '_'):
+    builtins._ = str
+
+from gscpy.pr_geocode import pr_geocode  # noqa: E402
+
+
+class Scene(object):
+    """
+    Stand-in for a pyroSAR ID object of a Sentinel-1 scene.
+    """
+
+    def __init__(self, scene, samples=100, lines=100, start='20180101T060000', product='GRD', acquisition_mode='IW',
+                 orbit=1000, extent=None, ipf=3.1, poe=True):
+        self.scene = scene
+        self.samples = samples
+        self.lines = lines
+        self.start = start
+        self.product = product
+        self.acquisition_mode = acquisition_mode
+        self.orbitNumber_abs = orbit
+        self.sensor = 'S1A'
+        self.polarizations = ['VV', 'VH']
+        self.extent = extent or {'xmin': 9.0, 'xmax': 10.0, 'ymin': 51.0, 'ymax': 52.0}
+        self.meta = {'IPF_version': ipf}
+        # Precise orbit files are published about three weeks after the acquisition.
+        self.poe = poe
+        self.osv = []
+
+    def outname_base(self, extensions=None):
+        return '{0}__{1}__{2}_{3}'.format(self.sensor, self.acquisition_mode, self.product, self.start)
+
+    def bbox(self):
+        return _BBox(self.extent)
+
+    def getOSV(self, osvType='POE', returnMatch=False):
+        self.osv.append(osvType)
+
+        if osvType == 'POE' and not self.poe:
+            return None
+
+        return '{0}.EOF'.format(osvType) if returnMatch else None
+
+
+class _BBox(object):
+    def __init__(self, extent):
+        self.extent = extent
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+def _graph(scene, outdir, offset=None):
+    # pyroSAR builds the Subset region from the samples and lines of the scene it is called with.
+    graph = ET.Element('graph', id='Graph')
+    read = ET.SubElement(graph, 'node', id='Read')
+    ET.SubElement(ET.SubElement(read, 'parameters'), 'file').text = scene.scene
+
+    orbit = ET.SubElement(graph, 'node', id='Apply-Orbit-File')
+    ET.SubElement(ET.SubElement(orbit, 'sources'), 'sourceProduct', refid='Read')
+    ET.SubElement(ET.SubElement(orbit, 'parameters'), 'orbitType').text = (
+        'Sentinel Precise (Auto Download)' if scene.poe else 'Sentinel Restituted (Auto Download)')
+    source = 'Apply-Orbit-File'
+
+    if offset is not None:
+        left, right, top, bottom = offset
+        subset = ET.SubElement(graph, 'node', id='Subset')
+        ET.SubElement(ET.SubElement(subset, 'sources'), 'sourceProduct', refid=source)
+        ET.SubElement(ET.SubElement(subset, 'parameters'), 'region').text = '{0},{1},{2},{3}'.format(
+            left, top, scene.samples - left - right, scene.lines - top - bottom)
+        source = 'Subset'
+
+    write = ET.SubElement(graph, 'node', id='Write')
+    ET.SubElement(ET.SubElement(write, 'sources'), 'sourceProduct', refid=source)
+    parameters = ET.SubElement(write, 'parameters')
+    ET.SubElement(parameters, 'file').text = os.path.join(outdir, scene.outname_base())
+    ET.SubElement(parameters, 'formatName').text = 'GeoTIFF'
+
+    return graph
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    # The scene cache lives in the cache directory of the user.
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+
+    return tmp_path / 'cache'
+
+
+@pytest.fixture
+def snap(monkeypatch):
+    """
+    Replace pyroSAR's SNAP interface. Every executed graph is recorded as dict with the input file, the subset region
+    and the output file, and writes an empty GeoTIFF per polarization. The workers run as threads, so they see the
+    replaced modules.
+    """
+    runs = []
+
+    def execute(root):
+        region = root.find(".//node[@id='Subset']/parameters/region")
+        outfile = root.find(pr_geocode._WRITE_FILE).text
+        runs.append({'scene': root.find(pr_geocode._READ_FILE).text,
+                     'region': region.text if region is not None else None, 'outfile': outfile,
+                     'orbit': root.find(pr_geocode._ORBIT_TYPE).text})
+
+        for polarization in ('VV', 'VH'):
+            open('{0}_{1}.tif'.format(outfile, polarization), 'w').close()
+
+    def geocode(scene, outdir, test=False, offset=None, **kwargs):
+        # Like pyroSAR, slices are sorted by time and the products are named after the first one.
+        scenes = sorted(scene, key=lambda item: item.start) if isinstance(scene, list) else [scene]
+        root = _graph(scenes[0], outdir, offset)
+
+        if test:
+            ET.ElementTree(root).write(os.path.join(outdir, scenes[0].outname_base() + '_proc.xml'))
+        else:
+            execute(root)
+
+    def gpt(xmlfile):
+        execute(ET.parse(xmlfile).getroot())
+
+    util = types.ModuleType('pyroSAR.snap.util')
+    util.geocode = geocode
+    auxil = types.ModuleType('pyroSAR.snap.auxil')
+    auxil.gpt = gpt
+
+    monkeypatch.setitem(sys.modules, 'pyroSAR', types.ModuleType('pyroSAR'))
+    monkeypatch.setitem(sys.modules, 'pyroSAR.snap', types.ModuleType('pyroSAR.snap'))
+    monkeypatch.setitem(sys.modules, 'pyroSAR.snap.util', util)
+    monkeypatch.setitem(sys.modules, 'pyroSAR.snap.auxil', auxil)
+    monkeypatch.setattr(pr_geocode, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(pr_geocode, '_tile_geotiff', lambda filename: None)
+
+    return runs
+
+
+@pytest.fixture
+def make_geocode(tmp_path):
+    """
+    Factory of Geocode objects for the given scenes. The scene files are created in tmp_path/input and the scenes are
+    set directly, so pyroSAR does not identify them.
+    """
+    input_dir = tmp_path / 'input'
+    input_dir.mkdir()
+
+    def factory(scenes, **kwargs):
+        for scene in scenes:
+            scene.scene = str(input_dir / scene.scene)
+            open(scene.scene, 'a').close()
+
+        kwargs.setdefault('t_srs', 4326)
+        geo = pr_geocode.Geocode(str(input_dir), str(tmp_path / 'output'), **kwargs)
+        geo._scenes = {scene.scene: scene for scene in scenes}
+        geo._files = list(geo._scenes)
+
+        return geo
+
+    return factory
+
+
+@pytest.fixture
+def scene():
+    return Scene
@@ -0,0 +1,408 @@
+import asyncio
+import glob
+import os
+import subprocess
+import sys
+import time
+import types
+
+import pytest
+
+from gscpy.pr_geocode import pr_geocode
+
+
+def _outputs(geo):
+    return sorted(os.path.basename(item) for item in glob.glob(os.path.join(geo.outdir, '*.tif')))
+
+
+def _markers(geo):
+    return glob.glob(os.path.join(geo.outdir, '.S1A*'))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# DEM Subset
+# ----------------------------------------------------------------------------------------------------------------------
+@pytest.fixture
+def subset_dem(monkeypatch):
+    calls = []
+
+    def subset(filename, outfile, extent):
+        calls.append((filename, outfile, extent))
+        open(outfile, 'w').close()
+
+    monkeypatch.setattr(pr_geocode, '_subset_dem', subset)
+
+    return calls
+
+
+def test_subset_dem_covers_all_scenes(subset_dem, make_geocode, scene, tmp_path):
+    dem = tmp_path / 'dem.tif'
+    dem.touch()
+    geo = make_geocode([scene('a.zip', extent={'xmin': 9.0, 'xmax': 10.0, 'ymin': 51.0, 'ymax': 52.0}),
+                        scene('b.zip', start='20180102T060000',
+                              extent={'xmin': 11.0, 'xmax': 12.0, 'ymin': 50.0, 'ymax': 51.0})],
+                       external_dem_file=str(dem))
+    groups = geo._Geocode__groups()
+
+    outfile = geo._Geocode__subset_dem(groups)
+
+    assert os.path.dirname(outfile) == os.path.join(geo.outdir, '.pyrosar_cache', 'dem')
+    assert subset_dem[0][0] == str(dem)
+    assert subset_dem[0][2] == pytest.approx((8.9, 52.1, 12.1, 49.9))
+
+    # The subset of the same DEM and footprint is reused.
+    assert geo._Geocode__subset_dem(groups) == outfile
+    assert len(subset_dem) == 1
+
+
+def test_subset_dem_without_scenes(subset_dem, make_geocode, tmp_path):
+    dem = tmp_path / 'dem.tif'
+    dem.touch()
+    geo = make_geocode([], external_dem_file=str(dem))
+
+    assert geo._Geocode__subset_dem([]) == str(dem)
+    assert subset_dem == []
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Skip Processed Scenes
+# ----------------------------------------------------------------------------------------------------------------------
+def test_processed_scene_is_skipped(snap, make_geocode, scene):
+    geo = make_geocode([scene('a.zip')])
+
+    asyncio.run(geo.geocode_async())
+    asyncio.run(geo.geocode_async())
+
+    assert len(snap) == 1
+
+
+def test_updated_scene_is_processed_again(snap, make_geocode, scene):
+    a = scene('a.zip')
+    geo = make_geocode([a])
+    asyncio.run(geo.geocode_async())
+
+    later = time.time() + 60
+    os.utime(a.scene, (later, later))
+    asyncio.run(geo.geocode_async())
+
+    assert len(snap) == 2
+
+
+def test_changed_parameters_replace_outputs(snap, make_geocode, scene):
+    a = scene('a.zip')
+    geo = make_geocode([a])
+    asyncio.run(geo.geocode_async())
+    # A polarization that the new parameters do not produce.
+    open(os.path.join(geo.outdir, a.outname_base() + '_HH.tif'), 'w').close()
+
+    geo = make_geocode([], resolution_value=10)
+    geo._scenes = {a.scene: a}
+    geo._files = [a.scene]
+    asyncio.run(geo.geocode_async())
+
+    assert len(snap) == 2
+    assert _outputs(geo) == [a.outname_base() + '_VH.tif', a.outname_base() + '_VV.tif']
+    assert _markers(geo) == [geo._Geocode__marker(a.scene)]
+
+
+def test_partial_outputs_are_processed_again(snap, make_geocode, scene):
+    a = scene('a.zip')
+    geo = make_geocode([a])
+    asyncio.run(geo.geocode_async())
+    # An interrupted run, which wrote only one polarization and no marker.
+    os.remove(geo._Geocode__marker(a.scene))
+    os.remove(os.path.join(geo.outdir, a.outname_base() + '_VH.tif'))
+
+    asyncio.run(geo.geocode_async())
+
+    assert len(snap) == 2
+    assert _outputs(geo) == [a.outname_base() + '_VH.tif', a.outname_base() + '_VV.tif']
+    assert _markers(geo) == [geo._Geocode__marker(a.scene)]
+
+
+def test_complete_outputs_without_marker_are_kept(snap, make_geocode, scene):
+    a = scene('a.zip')
+    geo = make_geocode([a])
+    asyncio.run(geo.geocode_async())
+    os.remove(geo._Geocode__marker(a.scene))
+
+    asyncio.run(geo.geocode_async())
+
+    assert len(snap) == 1
+
+
+def test_marker_written_after_tiles(snap, make_geocode, scene, monkeypatch):
+    a = scene('a.zip')
+    geo = make_geocode([a])
+    markers = []
+    monkeypatch.setattr(pr_geocode, '_tile_geotiff', lambda filename: markers.append(_markers(geo)))
+
+    asyncio.run(geo.geocode_async())
+
+    assert markers == [[], []]
+    assert _markers(geo) == [geo._Geocode__marker(a.scene)]
+    assert not glob.glob(os.path.join(geo.outdir, 'tmp*'))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Slice Assembly
+# ----------------------------------------------------------------------------------------------------------------------
+def test_slices_named_after_first_slice(snap, make_geocode, scene, monkeypatch):
+    first, second = scene('a.zip', start='20180101T060000'), scene('b.zip', start='20180101T060025')
+    # The directory walk yields the later slice first.
+    geo = make_geocode([second, first])
+    tiled = []
+    monkeypatch.setattr(pr_geocode, '_tile_geotiff', tiled.append)
+
+    asyncio.run(geo.geocode_async())
+    asyncio.run(geo.geocode_async())
+
+    assert len(snap) == 1
+    assert sorted(os.path.basename(item) for item in tiled) == [first.outname_base() + '_VH.tif',
+                                                                first.outname_base() + '_VV.tif']
+    assert _markers(geo) == [geo._Geocode__marker(first.scene)]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Scene Cache
+# ----------------------------------------------------------------------------------------------------------------------
+@pytest.fixture
+def identify(snap, monkeypatch, scene):
+    identified = []
+
+    def fake(filename):
+        identified.append(filename)
+        return scene(filename)
+
+    monkeypatch.setattr(pr_geocode, '_identify', fake)
+
+    return identified
+
+
+def test_identified_scenes_are_cached(identify, make_geocode, cache_home):
+    geo = make_geocode([])
+    infile = os.path.join(geo.input_dir, 'a.zip')
+    open(infile, 'w').close()
+
+    for _ in range(2):
+        geo._files = None
+        assert geo.files == [infile]
+
+    assert identify == [infile]
+    assert pr_geocode._cache_dir().startswith(str(cache_home))
+    assert not os.path.exists(os.path.join(geo.outdir, '.pyrosar_cache'))
+
+
+@pytest.mark.parametrize('content', [b'cgscpy.pr_geocode.pr_geocode\nNoSuchClass\n.', b'cno_such_module\nScene\n.',
+                                     b'\x80\x04', b'not a pickle'])
+def test_unreadable_cache_identifies_again(identify, make_geocode, content):
+    geo = make_geocode([])
+    infile = os.path.join(geo.input_dir, 'a.zip')
+    open(infile, 'w').close()
+    path = pr_geocode._cache_path(pr_geocode._cache_dir(), infile)
+    os.makedirs(os.path.dirname(path))
+
+    with open(path, 'wb') as fp:
+        fp.write(content)
+
+    geo._files = None
+
+    assert geo.files == [infile]
+    assert identify == [infile]
+
+
+def test_changed_scene_is_identified_again(identify, make_geocode):
+    geo = make_geocode([])
+    infile = os.path.join(geo.input_dir, 'a.zip')
+    open(infile, 'w').close()
+    geo._files = None
+    geo.files
+
+    with open(infile, 'w') as fp:
+        fp.write('changed')
+
+    geo._files = None
+    geo.files
+
+    assert identify == [infile, infile]
+
+
+@pytest.mark.parametrize('pattern, expected', [(None, ['S1A_a.zip', 'S1B_b.zip', 'xS1A_a.zip']),
+                                               ('S1A_a', ['S1A_a.zip']), ('S1A_.*', ['S1A_a.zip']),
+                                               ('S1._b', ['S1B_b.zip'])])
+def test_files_match_pattern(identify, make_geocode, pattern, expected):
+    geo = make_geocode([], pattern=pattern)
+
+    for name in ('S1A_a.zip', 'S1B_b.zip', 'S1A_c.txt', 'xS1A_a.zip'):
+        open(os.path.join(geo.input_dir, name), 'w').close()
+
+    geo._files = None
+
+    assert sorted(os.path.basename(item) for item in geo.files) == expected
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Failed Scenes
+# ----------------------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize('error', [RuntimeError, OSError, ValueError, subprocess.CalledProcessError(1, 'gpt')])
+def test_failed_scene_does_not_stop_the_others(snap, make_geocode, scene, monkeypatch, error):
+    a, b = scene('a.zip', start='20180101T060000'), scene('b.zip', start='20180102T060000')
+    geo = make_geocode([a, b])
+    geocode = sys.modules['pyroSAR.snap.util'].geocode
+
+    def fail(item, outdir, **kwargs):
+        if item is a:
+            raise error
+
+        return geocode(item, outdir, **kwargs)
+
+    monkeypatch.setattr(sys.modules['pyroSAR.snap.util'], 'geocode', fail)
+    # Without shared workflows every scene goes through pyroSAR's geocode.
+    monkeypatch.setattr(geo, '_Geocode__workflows', lambda groups, kwargs: {})
+
+    asyncio.run(geo.geocode_async())
+
+    assert [run['scene'] for run in snap] == [b.scene]
+    assert _markers(geo) == [geo._Geocode__marker(b.scene)]
+
+
+def test_unreadable_scene_is_skipped(snap, make_geocode, monkeypatch):
+    geo = make_geocode([])
+    infile = os.path.join(geo.input_dir, 'a.zip')
+    open(infile, 'w').close()
+
+    def identify(filename):
+        raise OSError('corrupt archive')
+
+    monkeypatch.setitem(sys.modules, 'pyroSAR', types.SimpleNamespace(identify=identify))
+    geo._files = None
+
+    assert geo.files == []
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Input Directory
+# ----------------------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize('error', [FileNotFoundError, PermissionError, NotADirectoryError])
+def test_inaccessible_input_dir_is_fatal(tmp_path, monkeypatch, error):
+    class Fatal(Exception):
+        pass
+
+    def fatal(msg):
+        raise Fatal(msg)
+
+    input_dir = str(tmp_path / 'input')
+    real_stat = os.stat
+
+    def stat(path, *args, **kwargs):
+        if path == input_dir:
+            raise error(0, 'error', path)
+
+        return real_stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(pr_geocode.gs, 'fatal', fatal)
+    monkeypatch.setattr(os, 'stat', stat)
+
+    with pytest.raises(Fatal):
+        pr_geocode.Geocode(input_dir, str(tmp_path / 'output'), t_srs=4326)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# SNAP Resources
+# ----------------------------------------------------------------------------------------------------------------------
+def test_snap_limits_are_set(monkeypatch):
+    monkeypatch.delenv('_JAVA_OPTIONS', raising=False)
+    monkeypatch.setattr(os, 'cpu_count', lambda: 8)
+
+    pr_geocode._limit_snap_resources(4)
+
+    options = os.environ['_JAVA_OPTIONS'].split()
+    assert options[0] == '-Dsnap.parallelism=2'
+    assert [item[:4] for item in options[1:]] in ([], ['-Xmx'])
+
+
+def test_snap_limits_are_appended_to_user_options(monkeypatch):
+    monkeypatch.setenv('_JAVA_OPTIONS', '-Xmx4g -Dfile.encoding=UTF-8')
+    monkeypatch.setattr(os, 'cpu_count', lambda: 8)
+
+    pr_geocode._limit_snap_resources(4)
+    pr_geocode._limit_snap_resources(4)
+
+    assert os.environ['_JAVA_OPTIONS'] == '-Xmx4g -Dfile.encoding=UTF-8 -Dsnap.parallelism=2'
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Shared Workflows
+# ----------------------------------------------------------------------------------------------------------------------
+def test_workflow_shared_between_scenes_of_one_kind(snap, make_geocode, scene):
+    geo = make_geocode([scene('a.zip', 100, 200, start='20180101T060000'),
+                        scene('b.zip', 300, 400, start='20180102T060000')])
+
+    asyncio.run(geo.geocode_async())
+
+    assert len(geo._workflows) == 1
+    assert sorted(run['scene'] for run in snap) == sorted(geo.files)
+    assert len({run['outfile'] for run in snap}) == 2
+
+
+def test_workflows_built_once_per_kind(snap, make_geocode, scene):
+    geo = make_geocode([scene('a.zip', start='20180101T060000'),
+                        scene('b.zip', start='20180102T060000'),
+                        scene('c.zip', start='20180101T060000', product='SLC'),
+                        scene('d.zip', start='20180103T060000', acquisition_mode='EW'),
+                        scene('e.zip', start='20180103T060025', acquisition_mode='EW')])
+    groups = geo._Geocode__groups()
+
+    workflows = geo._Geocode__workflows(groups, geo._Geocode__geocode_kwargs())
+
+    # The slices d and e are assembled by pyroSAR, so their kind gets no workflow.
+    assert sorted(key[1:3] for key in workflows) == [('GRD', 'IW'), ('SLC', 'IW')]
+    assert os.listdir(geo.outdir) == []
+
+
+def test_offset_builds_graph_per_scene(snap, make_geocode, scene):
+    geo = make_geocode([scene('a.zip', 100, 200, start='20180101T060000'),
+                        scene('b.zip', 300, 400, start='20180102T060000')], offset=(10, 10, 20, 20))
+
+    asyncio.run(geo.geocode_async())
+
+    assert geo._workflows == {}
+    assert {os.path.basename(run['scene']): run['region'] for run in snap} == {'a.zip': '10,20,80,160',
+                                                                                'b.zip': '10,20,280,360'}
+
+
+def test_border_noise_removed_by_pyrosar_builds_graph_per_scene(snap, make_geocode, scene):
+    geo = make_geocode([scene('a.zip', start='20180101T060000', ipf=2.84),
+                        scene('b.zip', start='20180102T060000', ipf=2.84),
+                        scene('c.zip', start='20180103T060000', ipf=2.91),
+                        scene('d.zip', start='20180104T060000', ipf=2.91)])
+
+    asyncio.run(geo.geocode_async())
+
+    assert [key[-1] for key in geo._workflows] == [False]
+    assert len(snap) == 4
+
+
+def test_geocode_workflow_replaces_input_and_output(snap, make_geocode, scene):
+    a, b = scene('a.zip', start='20180101T060000'), scene('b.zip', start='20180102T060000')
+    geo = make_geocode([a, b])
+    workflows = geo._Geocode__workflows(geo._Geocode__groups(), geo._Geocode__geocode_kwargs())
+    workflow = workflows[pr_geocode._workflow_key(a)]
+
+    pr_geocode._geocode_workflow(b, geo.outdir, workflow)
+
+    assert snap == [{'scene': b.scene, 'region': None, 'outfile': os.path.join(geo.outdir, b.outname_base()),
+                     'orbit': pr_geocode._ORBIT_TYPES['POE']}]
+    assert os.path.exists(os.path.join(geo.outdir, b.outname_base() + '_proc.xml'))
+
+
+def test_geocode_workflow_chooses_orbit_per_scene(snap, make_geocode, scene):
+    # The workflow is built for an old scene with precise orbits, the recent scene only has restituted ones.
+    old, recent = scene('a.zip', start='20180101T060000'), scene('b.zip', start='20180102T060000', poe=False)
+    geo = make_geocode([old, recent])
+
+    asyncio.run(geo.geocode_async())
+
+    assert {os.path.basename(run['scene']): run['orbit'] for run in snap} == {'a.zip': pr_geocode._ORBIT_TYPES['POE'],
+                                                                               'b.zip': pr_geocode._ORBIT_TYPES['RES']}
+    assert recent.osv == ['POE', 'RES']
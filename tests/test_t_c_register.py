@@ -0,0 +1,149 @@
+import types
+
+import pytest
+
+from gscpy.t_c_register import t_c_register
+
+
+@pytest.fixture
+def grass(monkeypatch):
+    """
+    Replace the GRASS modules that CRegister starts. Every call is recorded as (module, options) and g.list returns
+    the maps in `maps`.
+    """
+    calls = []
+    state = types.SimpleNamespace(calls=calls, maps=['a', 'b'])
+
+    def parse_command(module, flags='', **kwargs):
+        calls.append((module, kwargs))
+        return dict.fromkeys(state.maps)
+
+    def run_command(module, flags='', **kwargs):
+        calls.append((module, kwargs))
+
+    monkeypatch.setattr(t_c_register.gs, 'parse_command', parse_command, raising=False)
+    monkeypatch.setattr(t_c_register.gs, 'run_command', run_command, raising=False)
+    monkeypatch.setattr(t_c_register, 'tgis', None)
+    t_c_register.CRegister.invalidate_list_cache()
+
+    yield state
+
+    t_c_register.CRegister.invalidate_list_cache()
+
+
+def _cregister(**kwargs):
+    return t_c_register.CRegister('tempmean', 'Title', 'Description', '2000-01-01', pattern='*tempmean', **kwargs)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Map Listing
+# ----------------------------------------------------------------------------------------------------------------------
+def test_maps_are_listed_once(grass):
+    assert _cregister().files == ['a', 'b']
+    assert _cregister().files == ['a', 'b']
+
+    assert [module for module, kwargs in grass.calls] == ['g.list']
+
+
+def test_invalidated_list_cache_lists_again(grass):
+    _cregister().files
+    grass.maps = ['a', 'b', 'c']
+    t_c_register.CRegister.invalidate_list_cache()
+
+    assert _cregister().files == ['a', 'b', 'c']
+    assert [module for module, kwargs in grass.calls] == ['g.list', 'g.list']
+
+
+def test_other_options_are_listed_separately(grass):
+    _cregister().files
+    _cregister(mapset='PERMANENT').files
+
+    assert [kwargs.get('mapset') for module, kwargs in grass.calls] == [None, 'PERMANENT']
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Create and Register
+# ----------------------------------------------------------------------------------------------------------------------
+class FatalError(Exception):
+    pass
+
+
+@pytest.fixture
+def tgis(grass, monkeypatch):
+    """
+    Replace the temporal framework. Every call is recorded in the calls of `grass` as (function, arguments).
+    """
+    def record(name):
+        return lambda *args, **kwargs: grass.calls.append((name, args, kwargs))
+
+    module = types.SimpleNamespace(init=record('init'), open_new_stds=record('open_new_stds'),
+                                   register_maps_in_space_time_dataset=record('register'))
+
+    monkeypatch.setattr(t_c_register, 'tgis', module)
+    monkeypatch.setattr(t_c_register, 'FatalError', FatalError, raising=False)
+
+    return module
+
+
+def test_cregister_with_modules(grass):
+    _cregister(increment='1 months').cregister(t=True)
+
+    calls = dict(grass.calls)
+    assert calls['t.create'] == {'output': 'tempmean', 'temporaltype': 'absolute', 'title': 'Title',
+                                 'description': 'Description', 'type': 'strds'}
+    assert calls['t.register']['maps'] == ['a', 'b']
+    assert calls['t.register']['increment'] == '1 months'
+
+
+def test_cregister_with_temporal_framework(grass, tgis):
+    _cregister(increment='1 months').cregister(t=True)
+
+    calls = {call[0]: call[1:] for call in grass.calls}
+    assert sorted(calls) == ['g.list', 'init', 'open_new_stds', 'register']
+    assert calls['open_new_stds'][0][:5] == ('tempmean', 'strds', 'absolute', 'Title', 'Description')
+    assert calls['register'] == (('raster', 'tempmean'), {'maps': 'a,b', 'start': '2000-01-01', 'unit': None,
+                                                         'increment': '1 months', 'interval': True})
+
+
+@pytest.mark.parametrize('framework', [False, True])
+def test_cregister_without_maps_skips_registration(grass, request, framework):
+    if framework:
+        request.getfixturevalue('tgis')
+
+    grass.maps = []
+
+    _cregister().cregister()
+
+    assert not {'t.register', 'register'} & {call[0] for call in grass.calls}
+
+
+@pytest.mark.parametrize('framework', [False, True])
+def test_failed_create_is_fatal(grass, request, monkeypatch, framework):
+    class Fatal(Exception):
+        pass
+
+    def fatal(msg):
+        raise Fatal(msg)
+
+    if framework:
+        def open_new_stds(*args):
+            raise FatalError('exists')
+
+        monkeypatch.setattr(request.getfixturevalue('tgis'), 'open_new_stds', open_new_stds)
+    else:
+        run_command = t_c_register.gs.run_command
+
+        def fail(module, flags='', **kwargs):
+            if module == 't.create':
+                raise t_c_register.CalledModuleError('exists')
+
+            run_command(module, flags=flags, **kwargs)
+
+        monkeypatch.setattr(t_c_register.gs, 'run_command', fail)
+
+    monkeypatch.setattr(t_c_register.gs, 'fatal', fatal)
+
+    with pytest.raises(Fatal):
+        _cregister().cregister()
+
+    assert not {'t.register', 'register'} & {call[0] for call in grass.calls}